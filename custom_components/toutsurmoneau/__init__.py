@@ -1,11 +1,15 @@
 import logging
 
 from homeassistant import config_entries, core
+from homeassistant.helpers import aiohttp_client
 
 from .const import DOMAIN
+from .pysuez1 import SuezClient
 
 _LOGGER = logging.getLogger(__name__)
 
+PLATFORMS = ["sensor"]
+
 async def options_update_listener(
     hass: core.HomeAssistant, config_entry: config_entries.ConfigEntry
 ):
@@ -25,13 +29,23 @@ async def async_setup_entry(
     hass_data = {
         **entry.data,
         **entry.options,
-        "unsubscribe": entry.add_update_listener(options_update_listener)
     }
+    entry.async_on_unload(entry.add_update_listener(options_update_listener))
+    hass_data["client"] = SuezClient(
+        username=hass_data['username'],
+        password=hass_data['password'],
+        counter_id=hass_data['counter_id'],
+        provider=hass_data['provider'],
+        logger=_LOGGER,
+        # backed by the HA-wide connection pool, but with its own cookie
+        # jar: the login cookie must not leak to other integrations.
+        # HA detaches it when the entry is unloaded
+        session=aiohttp_client.async_create_clientsession(hass))
     _LOGGER.debug(f"setup entry: {entry.data=}, {entry.options=}")
     hass.data[DOMAIN][entry.entry_id] = hass_data
     _LOGGER.info(f"setup entry: setting up suez sensors")
     _LOGGER.debug(f"setup entry: with {entry.entry_id=}, {hass_data}")
-    await hass.config_entries.async_forward_entry_setup(entry, "sensor")
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
 
 async def async_unload_entry(
@@ -40,11 +54,11 @@ async def async_unload_entry(
     """
     Unload a config entry
     """
-    unload_ok = await hass.config_entries.async_unload_platforms(entry, ["sensor"])
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
         _LOGGER.info(f"unload entry: removing at {entry.entry_id=}")
         hass_data = hass.data[DOMAIN][entry.entry_id]
         _LOGGER.debug(f"unload entry: {hass_data=}")
-        hass_data["unsubscribe"]()
+        await hass_data["client"].close()
         hass.data[DOMAIN].pop(entry.entry_id)
     return unload_ok
@@ -1,4 +1,3 @@
-from collections import OrderedDict
 import logging
 
 from homeassistant.config_entries import ConfigFlow, OptionsFlow
@@ -12,6 +11,8 @@ from .pysuez1 import SuezClient
 
 _LOGGER = logging.getLogger(__name__)
 
+_PROVIDERS = SuezClient.providers()
+
 
 def schema(defaults=None):
     """
@@ -25,13 +26,13 @@ def schema(defaults=None):
 
     defaults for all the parameters are taken from the `defaults`
     """
-    source = defaults or dict()
-    sch = OrderedDict()
-    sch[vol.Required(CONF_COUNTER_ID, default=source.get(CONF_COUNTER_ID, ""))] = cv.string
-    sch[vol.Required(CONF_USERNAME, default=source.get(CONF_USERNAME, "user@example.org"))] = cv.string
-    sch[vol.Required(CONF_PASSWORD, default=source.get(CONF_PASSWORD, ""))] = cv.string
-    sch[vol.Optional(CONF_PROVIDER, default=source.get(CONF_PROVIDER, None))] = vol.In(SuezClient.providers())
-    return vol.Schema(sch)
+    source = defaults or {}
+    return vol.Schema({
+        vol.Required(CONF_COUNTER_ID, default=source.get(CONF_COUNTER_ID, "")): cv.string,
+        vol.Required(CONF_USERNAME, default=source.get(CONF_USERNAME, "user@example.org")): cv.string,
+        vol.Required(CONF_PASSWORD, default=source.get(CONF_PASSWORD, "")): cv.string,
+        vol.Optional(CONF_PROVIDER, default=source.get(CONF_PROVIDER, None)): vol.In(_PROVIDERS),
+    })
 
 
 class SuezOptionsFlow(OptionsFlow):
@@ -21,16 +21,29 @@
 """
 This is the module to interact with toutsurmoneau.fr
 """
-import argparse
 import asyncio
 import datetime
-import getpass
+import json
 import logging
-import pytz
 import re
+import time
+from zoneinfo import ZoneInfo
 
 import aiohttp
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# data on the website is updated in this timezone
+_PARIS = ZoneInfo('Europe/Paris')
+_NUMERIC = (int, float)
+_json_loads = orjson.loads if orjson is not None else json.loads
+_TOKEN_RE_1 = re.compile(r'csrf_token(.*)')
+_TOKEN_RE_2 = re.compile(r'csrfToken\\u0022\\u003A\\u0022([^,]+)\\u0022,\\u0022')
+_COUNTER_RE = re.compile(rb'exporter-consommation/month/([0-9]+)')
+
 
 class SuezError(Exception):
     """
@@ -38,6 +51,29 @@ class SuezError(Exception):
     """
 
 
+class SuezSessionError(SuezError):
+    """
+    The website answered with something else than data, most likely
+    because the session has expired
+    """
+
+
+def _to_day_map(rows, key_idx, first_idx, second_idx):
+    """
+    Build {key: (first, second)} out of the rows received from the website,
+    checking that the key is a string and both values are numbers
+    """
+    out = {}
+    for row in rows:
+        key = row[key_idx]
+        first = row[first_idx]
+        second = row[second_idx]
+        if not isinstance(key, str) or not isinstance(first, _NUMERIC) or not isinstance(second, _NUMERIC):
+            raise SuezError(f"{row} was expected to be (str, number, number)")
+        out[key] = (first, second)
+    return out
+
+
 class SuezClient():
     """
     SuezClient is a representation of the client view
@@ -54,28 +90,41 @@ class SuezClient():
         'Eau Olivet'    : 'https://www.eau-olivet.fr'
     }
     EPSILON = 0.000001
-
-    def __init__(self, username, password, counter_id, provider=None, timeout=None, logger=None):
+    LAST_KNOWN_DAYS = 60
+    COUNTER_SCAN_LIMIT = 65536
+    # a login is reused for the hourly retries, but the daily refresh
+    # logs in again: the server-side session would be gone by then
+    LOGIN_TTL = 2 * 3600
+    # set to True to also post the older login form field names
+    _LEGACY_FIELDS = False
+    DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+    def __init__(self, username, password, counter_id, provider=None, timeout=None, logger=None, session=None):
         """
         Initialize the client interface.
         Required parameters are userrname, password and counter_id
         provider is optional, if None then toutsurmoneau.fr will be used
-        timeout is well, the timeout - None is safe in most cases
+        timeout is well, the timeout - None means DEFAULT_TIMEOUT
         logger will be used to log some debugging data, default None is OK
+        session is an aiohttp.ClientSession to use; it is not closed by the client.
+        If None, a private session is created on first use
         """
         self._username = username
         self._password = password
         self._counter_id = counter_id
         self._token = ''
-        self._session = None
-        self._timeout = timeout
+        self._last_login = None
+        self._session = session
+        self._own_session = session is None
+        self._timeout = timeout or self.DEFAULT_TIMEOUT
         self._provider = provider or 'toutsurmoneau'
+        self._base_url = self._providers[self._provider]
         self._logger = logger or logging.getLogger(__name__)
 
         self.success = False
         self.uptodate = False
         self.lk_uptodate = False
-        self.attribution = None
+        self.attribution = f"Data provided by {self._provider} ({self._url('')})"
         self.last_known = None
         self.last = None
         self.this_month = None
@@ -87,16 +136,15 @@ class SuezClient():
 
     def _url(self, endpoint = ''):
         """ Use custom base URL if needed """
-        return self._providers[self._provider] + endpoint
+        return self._base_url + endpoint
 
     @classmethod
     def providers(cls):
-        """ Return list of known providers """
-        return list(cls._providers.keys())
+        """ Return tuple of known providers """
+        return tuple(cls._providers)
 
     def _get_token_1(self, content):
-        phrase = re.compile('csrf_token(.*)')
-        result = phrase.search(content)
+        result = _TOKEN_RE_1.search(content)
         if result is None:
             self._logger.info("cannot get token using method I")
             return None
@@ -104,8 +152,7 @@ class SuezClient():
         return result.group(1)
 
     def _get_token_2(self, content):
-        phrase = re.compile('csrfToken\\\\u0022\\\\u003A\\\\u0022([^,]+)\\\\u0022,\\\\u0022')
-        result = phrase.search(content)
+        result = _TOKEN_RE_2.search(content)
         if result is None:
             self._logger.info("cannot get token using method II")
             return None
@@ -114,7 +161,7 @@ class SuezClient():
 
     def _cookies(self):
         cookies = self._session.cookie_jar.filter_cookies(self._url())
-        self._logger.debug(f"{cookies=}")
+        self._logger.debug("cookies=%s", cookies)
         return cookies
 
     async def _get_token(self):
@@ -128,16 +175,19 @@ class SuezClient():
         if self._token is None:
             raise SuezError("Can't get token.")
 
-        self._logger.debug(f"Found token = {self._token}")
-        return {
-            '_username': self._username,
-            '_password': self._password,
+        self._logger.debug("Found token = %s", self._token)
+        data = {
             '_csrf_token': self._token,
-            'signin[username]': self._username,
-            'signin[password]': None,
             'tsme_user_login[_username]': self._username,
             'tsme_user_login[_password]': self._password
         }
+        if self._LEGACY_FIELDS:
+            data.update({
+                '_username': self._username,
+                '_password': self._password,
+                'signin[username]': self._username,
+            })
+        return data
 
     def _rq(self, url, data = None, method = None, **kwargs):
         verb = method
@@ -147,9 +197,9 @@ class SuezClient():
             verb = 'get'
         return self._session.request(verb, url, data=data, **kwargs)
 
-    async def _get_cookie(self):
+    async def _login(self):
         """
-        Connect and get the cookie
+        Submit the login form and return the cookies set by the response
         """
         data = await self._get_token()
         try:
@@ -157,20 +207,24 @@ class SuezClient():
                                 data=data,
                                 allow_redirects=False,
                                 timeout=self._timeout) as rq:
-               await rq.text(encoding='utf-8')
+                await rq.read()
+                return rq.cookies
         except OSError as exc:
             raise SuezError("Can not submit login form.") from exc
 
+    async def _get_cookie(self):
+        """
+        Connect and get the cookie
+        """
+        await self._login()
         if not 'eZSESSID' in self._cookies():
             raise SuezError("Login error: Please check your username/password.")
 
         return True
 
     def _fetch_url(self, url_tail, endpoint):
-        url = self._url(endpoint)
-        if url_tail:
-             url = url + "/" + url_tail
-        self._logger.info(f"Fetching {url=}")
+        url = f"{self._base_url}{endpoint}/{url_tail}" if url_tail else self._base_url + endpoint
+        self._logger.info("Fetching url=%r", url)
         return self._rq(url, timeout=self._timeout)
 
     async def _fetch_data_url(self, url_tail, endpoint=None):
@@ -183,20 +237,40 @@ class SuezClient():
         if ep is None:
             ep = self.API_ENDPOINT_DATA
         data = await self._fetch_url(url_tail, ep)
-        json = await data.json()
-        self._logger.debug(f"Loaded {json=}")
-        if len(json) and str(json[0]) == 'ERR':
-            raise SuezError(str(json[1]) if len(json) > 1 else "Unknown error")
-        return json
+        if data.status in (401, 403):
+            # give the connection back to the pool, the body is not needed
+            data.release()
+            raise SuezSessionError(f"Access denied to {url_tail}")
+        try:
+            content = _json_loads(await data.read())
+        except ValueError as exc:
+            raise SuezSessionError(f"Cannot decode data from {url_tail}") from exc
+        self._logger.debug("Loaded json=%s", content)
+        if len(content) and str(content[0]) == 'ERR':
+            raise SuezError(str(content[1]) if len(content) > 1 else "Unknown error")
+        return content
 
     async def _fetch_consumption(self):
         #
         # the counter_id can be found in some URLs on the page, like:
         #
-        pattern = re.compile('exporter-consommation/month/([0-9]+)')
-        data = await self._fetch_url('', self.API_ENDPOINT_CONSUMPTION)
-        counter_id = pattern.search(await data.text(encoding='utf-8'))
-        return counter_id.group(1)
+        # it appears early in the page, so do not download (and decode) the
+        # whole page, stop as soon as it is found
+        buf = bytearray()
+        async with self._fetch_url('', self.API_ENDPOINT_CONSUMPTION) as data:
+            async for chunk in data.content.iter_chunked(8192):
+                buf.extend(chunk)
+                counter_id = _COUNTER_RE.search(buf)
+                # a match at the very end may continue in the next chunk
+                if counter_id is not None:
+                    if counter_id.end() < len(buf):
+                        return counter_id.group(1).decode()
+                elif len(buf) > self.COUNTER_SCAN_LIMIT:
+                    raise SuezError("Cannot find the counter id")
+        counter_id = _COUNTER_RE.search(buf)
+        if counter_id is None:
+            raise SuezError("Cannot find the counter id")
+        return counter_id.group(1).decode()
 
     def ensure_type(self, candidate, typelist):
         """
@@ -207,19 +281,27 @@ class SuezClient():
                 raise SuezError(f"{value} was expected to be {expected_type}")
 
     async def _fetch_last_known(self, today):
-        now = today
-        _year_month = ""
+        """
+        Walk back up to LAST_KNOWN_DAYS days from today and return the first
+        total that is not zero. Each month is fetched once, then its days
+        are scanned from the end
+        """
         last_known_good = None
-        candidate = None
-        count = 0
-        while (last_known_good is None or last_known_good < 0.0001) and count < 60:
-            candidate = await self._fetch_cached(now)
+        remaining = self.LAST_KNOWN_DAYS
+        month = today
+        last_day = today.day
+        while remaining > 0:
+            candidate = await self._fetch_cached(month)
             if candidate is not None:
-                 date_txt, delta, total = candidate[now.day - 1]
-                 last_known_good = total
-                 self.ensure_type([total], [(int, float)])
-            now = now - datetime.timedelta(days=1)
-            count = count + 1
+                for (date_txt, delta, total) in reversed(candidate[max(last_day - remaining, 0):last_day]):
+                    if not isinstance(total, _NUMERIC):
+                        raise SuezError(f"{total} was expected to be {_NUMERIC}")
+                    last_known_good = total
+                    if last_known_good >= 0.0001:
+                        return last_known_good
+            remaining = remaining - last_day
+            month = month.replace(day=1) - datetime.timedelta(days=1)
+            last_day = month.day
         return last_known_good
 
     def _fetch_clear_cached(self):
@@ -228,15 +310,34 @@ class SuezClient():
     async def _fetch_cached(self, date):
        _year_month = f"{date.year}/{date.month}"
        if _year_month not in self._cached_data.keys() or self._cached_data[_year_month] is None:
-           self._logger.debug(f"Fetching data for {date.year}/{date.month}")
+           self._logger.debug("Fetching data for %s", _year_month)
            try:
                self._cached_data[_year_month] = await self._fetch_data_url(f"{_year_month}/{self._counter_id}")
-           except:
+           except SuezSessionError:
+               raise
+           except Exception:
                return None
        else:
-           self._logger.debug(f"Data for {date.year}/{date.month} is already here")
+           self._logger.debug("Data for %s is already here", _year_month)
        return self._cached_data[_year_month]
 
+    async def _ensure_login(self, force=False):
+        """
+        Log in, unless the previous login is less than LOGIN_TTL old, no
+        fetch has failed since, and its session cookie is still there
+
+        Returns True if the login was really done
+        """
+        if (not force and self._last_login is not None
+                and time.monotonic() - self._last_login < self.LOGIN_TTL
+                and 'eZSESSID' in self._cookies()):
+            self._logger.debug("Reusing the session cookie")
+            return False
+        self._last_login = None
+        await self._get_cookie()
+        self._last_login = time.monotonic()
+        return True
+
     async def _fetch_data(self):
         """
         Fetch latest data from Suez
@@ -245,19 +346,39 @@ class SuezClient():
         self.success = False
         self.uptodate = False
 
-        await self._get_cookie()
-
+        fresh_login = await self._ensure_login()
+        try:
+            try:
+                await self._fetch_all_data()
+            except SuezSessionError as exc:
+                if fresh_login:
+                    raise
+                # the session has probably expired on the server side
+                self._logger.info("Fetch failed with a reused session (%s), logging in again", exc)
+                await self._ensure_login(force=True)
+                await self._fetch_all_data()
+        except Exception:
+            # whatever went wrong, do not trust this session on the next call
+            self._last_login = None
+            raise
+
+    async def _fetch_all_data(self):
+        """
+        Fetch all the data, the client must be logged in
+        """
         if self._counter_id is None:
             self._counter_id = await self._fetch_consumption()
 
         self._fetch_clear_cached()
 
         # get the current time in France: data on the website is updated in this timezone
-        now = datetime.datetime.now(pytz.timezone('Europe/Paris'))
+        now = datetime.datetime.now(_PARIS)
 
         try:
             self.last_known = await self._fetch_last_known(now)
             self.lk_uptodate = True
+        except SuezSessionError:
+            raise
         except SuezError as exc:
             self.last_known = 0
 
@@ -265,14 +386,25 @@ class SuezClient():
         first_this_month = now.replace(day=1)
         prev_month = first_this_month - datetime.timedelta(days=1)
 
-        today_json = await self._fetch_cached(now)
+        # the remaining fetches are independent, so run them concurrently;
+        # each month is requested only once even if some days share it
+        months = list({(d.year, d.month): d for d in (now, yesterday, prev_month)}.values())
+        *months_json, history_json = await asyncio.gather(
+            *(self._fetch_cached(d) for d in months),
+            self._fetch_data_url(f'{self._counter_id}', endpoint=self.API_ENDPOINT_HISTORY),
+            return_exceptions=True)
+        for result in (*months_json, history_json):
+            if isinstance(result, BaseException):
+                raise result
+        by_month = {(d.year, d.month): j for (d, j) in zip(months, months_json)}
+
+        today_json = by_month[(now.year, now.month)]
         if today_json is None: today_json = {}
 
-        yesterday_json = await self._fetch_cached(yesterday)
+        yesterday_json = by_month[(yesterday.year, yesterday.month)]
         if yesterday_json is None: yesterday_json = {}
 
-        prev_month_json = await self._fetch_cached(prev_month)
-        history_json = await self._fetch_data_url(f'{self._counter_id}', endpoint=self.API_ENDPOINT_HISTORY)
+        prev_month_json = by_month[(prev_month.year, prev_month.month)]
 
         try:
             self.last = yesterday_json[yesterday.day - 1][1:]
@@ -281,18 +413,12 @@ class SuezClient():
             raise SuezError("Cannot read yesterday data") from exc
 
         try:
-            self.this_month = {j[0]: j[1:] for j in today_json}
-            for (month, consumption) in self.this_month.items():
-                self.ensure_type([month], [str])
-                self.ensure_type(consumption, [(int, float), (int, float)])
+            self.this_month = _to_day_map(today_json, 0, 1, 2)
         except Exception as exc:
             raise SuezError("Cannot read this month data") from exc
 
         try:
-            self.prev_month = {j[0]: j[1:] for j in prev_month_json}
-            for (month, consumption) in self.prev_month.items():
-                self.ensure_type([month], [str])
-                self.ensure_type(consumption, [(int, float), (int, float)])
+            self.prev_month = _to_day_map(prev_month_json, 0, 1, 2)
         except Exception as exc:
             raise SuezError("Cannot read previous month data") from exc
 
@@ -315,64 +441,86 @@ class SuezClient():
             raise SuezError("Cannot convert this_year_overall") from exc
 
         try:
-            self.history = {j[3]: j[1:3] for j in history_json[:-3]}
-            for (month, consumption) in self.history.items():
-                self.ensure_type([month], [str])
-                self.ensure_type(consumption, [(int, float), (int, float)])
+            self.history = _to_day_map(history_json[:-3], 3, 1, 2)
         except Exception as exc:
             raise SuezError("Cannot convert history") from exc
 
         self.success = True
         self.uptodate = self.last[0] > self.EPSILON
 
-        self.attribution = f"Data provided by {self._provider} ({self._url('')})"
-
     async def _check_credentials(self):
-        data = await self._get_token()
-        try:
-            response = await self._session.post(self._url(self.API_ENDPOINT_LOGIN),
-                                                data=data,
-                                                allow_redirects=False,
-                                                timeout=self._timeout)
-        except OSError as exc:
-            raise SuezError("Can not submit login form.") from exc
-        self._logger.debug(f"Got cookies {response.cookies}")
+        cookies = await self._login()
+        self._logger.debug("Got cookies %s", cookies)
 
-        return 'eZSESSID' in response.cookies
+        return 'eZSESSID' in cookies
 
     async def update_async(self):
         """Asynchronous update"""
-        async with self.session() as self._session:
-            return await self._fetch_data()
+        self._session = await self._ensure_session()
+        return await self._fetch_data()
 
     async def check_credentials_async(self):
         """Asynchronous check_credential"""
-        async with self.session() as self._session:
-            return await self._check_credentials()
+        self._session = await self._ensure_session()
+        return await self._check_credentials()
+
+    async def close(self):
+        """Close the underlying session, if it is owned by the client"""
+        if not self._own_session:
+            return
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _run_and_close(self, coro):
+        try:
+            return await coro
+        finally:
+            await self.close()
 
     def update(self):
         """Synchronous update"""
-        return asyncio.run(self.update_async())
+        return asyncio.run(self._run_and_close(self.update_async()))
 
     def check_credentials(self):
         """Asynchronous check_credential"""
-        return asyncio.run(self.check_credentials_async())
+        return asyncio.run(self._run_and_close(self.check_credentials_async()))
 
     async def _trace(self, session, context, params):
-        self._logger.debug(f'{params}')
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug('%s', params)
 
-    def session(self):
-        trace = aiohttp.TraceConfig()
-        trace.on_request_start.append(self._trace)
-        trace.on_request_end.append(self._trace)
-        trace.on_request_exception.append(self._trace)
-        return aiohttp.ClientSession(trace_configs = [trace])
+    async def _ensure_session(self):
+        """
+        Return the session, creating it on first use (or if it was closed),
+        so that connections are kept alive between the updates
+        """
+        if self._own_session and (self._session is None or self._session.closed):
+            traces = []
+            if self._logger.isEnabledFor(logging.DEBUG):
+                trace = aiohttp.TraceConfig()
+                trace.on_request_start.append(self._trace)
+                trace.on_request_end.append(self._trace)
+                trace.on_request_exception.append(self._trace)
+                traces.append(trace)
+            self._session = aiohttp.ClientSession(
+                trace_configs=traces,
+                connector=aiohttp.TCPConnector(limit=4,
+                                               limit_per_host=4,
+                                               ttl_dns_cache=3600,
+                                               enable_cleanup_closed=True,
+                                               keepalive_timeout=120))
+        return self._session
 
 
 def __main():
     """
     Main function
     """
+    # only needed for the command line, keep them off the import path
+    import argparse
+    import getpass
+
     parser = argparse.ArgumentParser()
     parser.add_argument('-u', '--username',
                         default=None,
@@ -1,8 +1,8 @@
-from collections import OrderedDict
-from dataclasses import dataclass
+import asyncio
 import datetime
-import pytz
 import logging
+import operator
+from typing import NamedTuple
 
 from homeassistant import config_entries, core
 from homeassistant.components.sensor import (
@@ -11,13 +11,15 @@ from homeassistant.components.sensor import (
     SensorStateClass,
 )
 from homeassistant.const import UnitOfVolume
+from homeassistant.helpers.event import async_track_time_change
 from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
     DataUpdateCoordinator,
+    UpdateFailed,
 )
 
 from .const import DOMAIN
-from .pysuez1 import SuezClient, SuezError
+from .pysuez1 import SuezError
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,41 +35,66 @@ async def async_setup_entry(
     config = hass.data[DOMAIN][config_entry.entry_id]
     _LOGGER.debug(f'async_setup_entry {config=}')
     coordinator = SuezCoordinator(hass, config)
-    await coordinator.async_config_entry_first_refresh()
-    async_add_entities(
-        SuezSensor(coordinator, idx, ent) for idx, ent in enumerate(coordinator.data)
-    )
-
-
-@dataclass
-class SuezSensorData:
+    entities = [
+        SuezSensor(coordinator, idx, desc.name, desc.state_class)
+        for idx, desc in enumerate(SUEZ_ATTRS)
+    ]
+    async_add_entities(entities, update_before_add=False)
+    # sensors start with placeholder data, there is no need to hold
+    # the startup until the first refresh completes
+    config_entry.async_create_task(hass, coordinator.async_refresh())
+    coordinator.async_schedule_daily(config_entry)
+
+
+class SuezAttrDesc(NamedTuple):
+    """
+    Describes a sensor: which SuezClient attribute (and which item of it,
+    if index is not None) provides its value
+    """
     name: str
-    value: int
-    unique_id: int
-    valid: bool
-    state_class: str
-    attribution: str
+    attr: str
+    index: int | None
+    state_class: str | None
+
+
+SUEZ_ATTRS = (
+    SuezAttrDesc('yesterday_delta'      , 'last', 0, None),
+    SuezAttrDesc('yesterday_total'      , 'last', 1, SensorStateClass.TOTAL),
+    SuezAttrDesc('last_known'           , 'last_known', None, SensorStateClass.TOTAL),
+    SuezAttrDesc('last_year_delta'      , 'last_year_overall', None, None),
+    SuezAttrDesc('this_year_delta'      , 'this_year_overall', None, None),
+    SuezAttrDesc('highest_monthly_delta', 'highest_monthly', None, None),
+)
 
+# (name, getter, index, uses last known validity) for each of SUEZ_ATTRS, built once
+_GETTERS = tuple(
+    (d.name, operator.attrgetter(d.attr), d.index, d.name == 'last_known')
+    for d in SUEZ_ATTRS
+)
 
-suez_attributes_map = OrderedDict([
-    ('yesterday_delta'      , {'attr': 'last', 'index': 0, 'state_class': None}),
-    ('yesterday_total'      , {'attr': 'last', 'index': 1, 'state_class' : SensorStateClass.TOTAL}),
-    ('last_known'           , {'attr': 'last_known', 'index': None, 'state_class' : SensorStateClass.TOTAL}),
-    ('last_year_delta'      , {'attr': 'last_year_overall', 'index': None, 'state_class': None}),
-    ('this_year_delta'      , {'attr': 'this_year_overall', 'index': None, 'state_class': None}),
-    ('highest_monthly_delta', {'attr': 'highest_monthly', 'index': None, 'state_class': None}),
-])
+# the part of device info which does not depend on the counter
+_DEVICE_INFO_TEMPLATE = {
+    "name": "SUEZ client",
+    "sw_version": "None",
+    "model": "",
+    "manufacturer": "SUEZ",
+}
 
 
 class SuezCoordinator(DataUpdateCoordinator):
     """
     SuezCoordinator is the central place of updating all the sensors
 
-    It is scheduled to update once per hour (may be less...) and sends updates
-    to all the sensors that are created
+    It is scheduled to update once per day (shortly after the data for the
+    previous day is published), and sends updates to all the sensors that
+    are created. If the update fails or the data is not there yet, it is
+    retried every POLL_DELAY_HOURS until it succeeds
     """
 
     POLL_DELAY_HOURS = 1
+    REFRESH_HOUR = 2
+    REFRESH_MINUTE = 5
+    UPDATE_TIMEOUT_SECONDS = 60
 
     def __init__(self, hass, info):
         """
@@ -77,91 +104,86 @@ class SuezCoordinator(DataUpdateCoordinator):
             hass,
             _LOGGER,
             name="suez_coordinator",
-            update_interval=datetime.timedelta(hours=self.POLL_DELAY_HOURS)
+            update_interval=None,
+            # listeners are only called when the published data changes
+            always_update=False
         )
-        self.last_update = None
         self.unique_id = info['counter_id']
-        self.suez = SuezClient(
-            username=info['username'],
-            password=info['password'],
-            counter_id=info['counter_id'],
-            provider=info['provider'],
-            logger=_LOGGER)
-        self.sensors = self._sensors_list(False, False)
-        # skip first update to speed up things
-        # the data will be retrieved on next poll
-        self._skip_update = True
-
-    def _suez_value(self, suez, desc):
-        """
-        Convert value received from suez API to what sensors expect
-        """
-        _LOGGER.debug(f"Trying to get attr {desc['attr']}")
-        try:
-            value = getattr(suez, desc['attr'])
-            index = desc['index']
-            return value if index is None or value is None else value[index]
-        except Exception as exc:
-            _LOGGER.error(f"On {desc['attr']}, exception happened: {exc}; returning None")
-            return None
+        self.suez = info['client']
+        self.attribution = self.suez.attribution
+        # (unique id, name) of the sensors, in SUEZ_ATTRS order
+        self.sensor_ids = tuple(
+            (f"suez_{self.unique_id}_{idx}", f"suez_{self.unique_id}_{d.name}")
+            for idx, d in enumerate(SUEZ_ATTRS)
+        )
+        # shared by all the sensors of this counter
+        self.device_info = {
+            **_DEVICE_INFO_TEMPLATE,
+            "identifiers": frozenset({(DOMAIN, f"suez_{self.unique_id}")}),
+        }
+        self.data = self._sensors_list(False, False)
 
     def _sensors_list(self, validity, lk_validity):
         """
-        returns list of sensor data (data might be invalid depending on validity parameter)
+        returns {sensor name: (value, valid)} (data might be invalid depending on validity parameter)
+        """
+        suez = self.suez
+        sensors = {}
+        for (name, get, index, is_last_known) in _GETTERS:
+            try:
+                value = get(suez)
+                if index is not None and value is not None:
+                    value = value[index]
+            except (AttributeError, IndexError, TypeError) as exc:
+                _LOGGER.error("On %s, exception happened: %s; returning None", name, exc)
+                value = None
+            sensors[name] = (value, lk_validity if is_last_known else validity)
+        return sensors
+
+    def async_schedule_daily(self, config_entry):
         """
-        return [SuezSensorData(
-            name=key,
-            value=self._suez_value(self.suez, desc),
-            unique_id=self.unique_id,
-            valid=lk_validity if key == 'last_known' else validity,
-            state_class=desc['state_class'],
-            attribution=self.suez.attribution
-        ) for (key, desc) in suez_attributes_map.items()]
-
-    def _now(self):
-        return datetime.datetime.now(pytz.timezone('Europe/Paris'))
-
-    def _needs_update(self):
+        Refresh every day at REFRESH_HOUR:REFRESH_MINUTE, until the entry is unloaded
         """
-        boolean: do we need to pull the data?
+        config_entry.async_on_unload(async_track_time_change(
+            self.hass,
+            self._scheduled_refresh,
+            hour=self.REFRESH_HOUR,
+            minute=self.REFRESH_MINUTE,
+            second=0))
+
+    async def _scheduled_refresh(self, _now):
         """
-        skip_update = self._skip_update
-        self._skip_update = False
-        if self.last_update is None:
-            return not skip_update
-        if skip_update:
-            return False
-        now = self._now()
-        return now.day != self.last_update.day
+        Daily refresh, called by the time tracker
+        """
+        await self.async_request_refresh()
 
     async def _async_update_data(self):
         """
         Get updates from Suez, and then return updated values for sensors
         """
-        _LOGGER.debug("Update tick!")
+        _LOGGER.debug("Update tick - fetching data")
+        # poll again later unless this update succeeds
+        self.update_interval = datetime.timedelta(hours=self.POLL_DELAY_HOURS)
         try:
-            if not self._needs_update():
-                raise SuezError("needs_update returned False")
-
-            _LOGGER.debug("Update tick - fetching data")
+            async with asyncio.timeout(self.UPDATE_TIMEOUT_SECONDS):
+                await self.suez.update_async()
 
-            await self.suez.update_async()
-
-            sensors = self._sensors_list(self.suez.uptodate, self.suez.lk_uptodate)
             if not self.suez.uptodate:
-                raise SuezError(f"not updated -- will fetch later")
+                _LOGGER.info("not updated -- will fetch later")
+                return self.data
 
-            self.last_update = self._now()
-            self.sensors = sensors
-            _LOGGER.debug(f"Update successful, next update is for tomorrow")
+            sensors = self._sensors_list(True, self.suez.lk_uptodate)
+            self.update_interval = None
+            _LOGGER.debug("Update successful, next update is for tomorrow")
+            return sensors
 
         except SuezError as exc:
-            _LOGGER.info(f"{exc} -- will not update")
+            _LOGGER.info("%s -- will retry later", exc)
 
-        except Exception as exc:
-            raise
+        except TimeoutError as exc:
+            raise UpdateFailed("suez timeout") from exc
 
-        return self.sensors
+        return self.data
 
 class SuezSensor(CoordinatorEntity, SensorEntity):
 
@@ -171,40 +193,34 @@ class SuezSensor(CoordinatorEntity, SensorEntity):
     as a source for the Energy dashboard
     """
 
-    def __init__(self, coordinator, idx, entry):
+    def __init__(self, coordinator, idx, name, state_class):
         """
         Initialize the sensor
         """
         super().__init__(coordinator, context=idx)
-        _LOGGER.debug(f'{idx=}, {entry=}')
-        self._unique_id = entry.unique_id
+        _LOGGER.debug(f'{idx=}, {name=}')
         self._idx = idx
+        self._name = name
         self._attr_device_class = SensorDeviceClass.WATER
         self._attr_native_unit_of_measurement = UnitOfVolume.CUBIC_METERS
-        self._attr_unit_of_measurement = UnitOfVolume.CUBIC_METERS
-        self._attr_attribution = entry.attribution
-        if entry.valid:
-            self._attr_native_value = entry.value
-        self._attr_state_class = entry.state_class
+        self._attr_attribution = coordinator.attribution
+        value, valid = coordinator.data[name]
+        if valid:
+            self._attr_native_value = value
+        self._attr_state_class = state_class
         self._attr_icon = "mdi:water-pump"
-        self._attr_unique_id = f"suez_{entry.unique_id}_{idx}"
-        self._attr_name = f'suez_{entry.unique_id}_{entry.name}'
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"suez_{self._unique_id}")},
-            "name": "SUEZ client",
-            "sw_version": "None",
-            "model": "",
-            "manufacturer": "SUEZ",
-        }
+        self._attr_unique_id, self._attr_name = coordinator.sensor_ids[idx]
+        self._attr_device_info = coordinator.device_info
 
     @core.callback
     def _handle_coordinator_update(self) -> None:
         """
         Handle updated data from the coordinator
         """
-        _LOGGER.info(f"Updating with {self.coordinator.data[self._idx]}")
-        sensor_data = self.coordinator.data[self._idx]
-        if sensor_data.valid:
-            _LOGGER.debug(f"{sensor_data.valid=}, updating the value")
-            self._attr_native_value = sensor_data.value
-            self.async_write_ha_state()
+        value, valid = self.coordinator.data[self._name]
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Updating %s with %s (valid=%s)", self._name, value, valid)
+        if not valid:
+            return
+        self._attr_native_value = value
+        self.async_write_ha_state()
@@ -0,0 +1,330 @@
+"""Test the toutsurmoneau.fr client."""
+import datetime
+import time
+
+import pytest
+
+from custom_components.toutsurmoneau.pysuez1 import (
+    SuezClient,
+    SuezError,
+    SuezSessionError,
+    _to_day_map,
+)
+
+
+class FakeContent:
+    """Stream that returns the given chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def iter_chunked(self, size):
+        for chunk in self._chunks:
+            yield chunk
+
+
+class FakeResponse:
+    """Response usable as `async with`, with a chunked body."""
+
+    def __init__(self, chunks):
+        self.content = FakeContent(chunks)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def make_client():
+    """Client that never touches the network."""
+    return SuezClient("user@example.org", "password", "123456")
+
+
+async def test_fetch_consumption_split_counter_id():
+    """Test that a counter id split between two chunks is read in full."""
+    client = make_client()
+    client._fetch_url = lambda url_tail, endpoint: FakeResponse([
+        b'<a href="/exporter-consommation/month/12',
+        b'345">export</a>',
+    ])
+    assert await client._fetch_consumption() == "12345"
+
+
+async def test_fetch_consumption_counter_id_at_eof():
+    """Test that a counter id ending the page is found."""
+    client = make_client()
+    client._fetch_url = lambda url_tail, endpoint: FakeResponse([
+        b'exporter-consommation/month/12',
+        b'345',
+    ])
+    assert await client._fetch_consumption() == "12345"
+
+
+async def test_fetch_consumption_counter_id_past_scan_limit():
+    """Test that a counter id split right past the scan limit is still read."""
+    client = make_client()
+    client._fetch_url = lambda url_tail, endpoint: FakeResponse([
+        b' ' * SuezClient.COUNTER_SCAN_LIMIT,
+        b'exporter-consommation/month/12',
+        b'345">',
+    ])
+    assert await client._fetch_consumption() == "12345"
+
+
+async def test_fetch_consumption_no_counter_id():
+    """Test that the scan gives up past the limit without a counter id."""
+    client = make_client()
+    client._fetch_url = lambda url_tail, endpoint: FakeResponse([
+        b' ' * SuezClient.COUNTER_SCAN_LIMIT,
+        b' ',
+        b'exporter-consommation/month/12345">',
+    ])
+    with pytest.raises(SuezError):
+        await client._fetch_consumption()
+
+
+class FakeDataResponse:
+    """Response to a data request."""
+
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+        self.released = False
+
+    async def read(self):
+        return self._body
+
+    def release(self):
+        self.released = True
+
+
+def fake_fetch_url(response):
+    async def fetch_url(url_tail, endpoint):
+        return response
+    return fetch_url
+
+
+async def test_fetch_data_url_login_page():
+    """Test that HTML instead of JSON is reported as a session error."""
+    client = make_client()
+    client._fetch_url = fake_fetch_url(FakeDataResponse(200, b"<html>login</html>"))
+    with pytest.raises(SuezSessionError):
+        await client._fetch_data_url("2023/1/123456")
+
+
+async def test_fetch_data_url_forbidden():
+    """Test that a 403 is reported as a session error, releasing the response."""
+    client = make_client()
+    response = FakeDataResponse(403, b"")
+    client._fetch_url = fake_fetch_url(response)
+    with pytest.raises(SuezSessionError):
+        await client._fetch_data_url("2023/1/123456")
+    assert response.released
+
+
+class LoginRecorder:
+    """Replace the network parts of the login/fetch sequence."""
+
+    def __init__(self, client, cookie, failures, last_login=None):
+        self.logins = 0
+        self.fetches = 0
+        self.cookie = cookie
+        self.failures = list(failures)
+        client._cookies = self.cookies
+        client._get_cookie = self.get_cookie
+        client._fetch_all_data = self.fetch_all_data
+        client._last_login = last_login
+
+    def cookies(self):
+        return {"eZSESSID": "x"} if self.cookie else {}
+
+    async def get_cookie(self):
+        self.logins += 1
+        self.cookie = True
+        return True
+
+    async def fetch_all_data(self):
+        self.fetches += 1
+        if self.failures:
+            raise self.failures.pop(0)
+
+
+async def test_first_fetch_logs_in():
+    """Test that a new client logs in even if a cookie is in the jar."""
+    client = make_client()
+    recorder = LoginRecorder(client, cookie=True, failures=[])
+    await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (1, 1)
+
+
+async def test_login_reused_while_recent():
+    """Test that a recent login with its cookie present is reused."""
+    client = make_client()
+    recorder = LoginRecorder(client, cookie=True, failures=[], last_login=time.monotonic())
+    await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (0, 1)
+
+
+async def test_login_when_cookie_gone():
+    """Test that the client logs in once the cookie has gone."""
+    client = make_client()
+    recorder = LoginRecorder(client, cookie=False, failures=[], last_login=time.monotonic())
+    await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (1, 1)
+
+
+async def test_login_when_too_old():
+    """Test that a login older than LOGIN_TTL is not reused."""
+    client = make_client()
+    last_login = time.monotonic() - SuezClient.LOGIN_TTL - 1
+    recorder = LoginRecorder(client, cookie=True, failures=[], last_login=last_login)
+    await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (1, 1)
+
+
+async def test_login_retried_when_session_rejected():
+    """Test the forced login and single retry with a stale session."""
+    client = make_client()
+    recorder = LoginRecorder(client, cookie=True, failures=[SuezSessionError("stale")],
+                             last_login=time.monotonic())
+    await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (1, 2)
+
+
+async def test_no_retry_after_fresh_login():
+    """Test that a session error right after logging in is not retried."""
+    client = make_client()
+    recorder = LoginRecorder(client, cookie=False, failures=[SuezSessionError("bad")])
+    with pytest.raises(SuezSessionError):
+        await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (1, 1)
+
+
+async def test_no_retry_on_missing_data():
+    """Test that missing data is not retried, but forces a login next time."""
+    client = make_client()
+    recorder = LoginRecorder(client, cookie=True, failures=[SuezError("no data")],
+                             last_login=time.monotonic())
+    with pytest.raises(SuezError):
+        await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (0, 1)
+    await client._fetch_data()
+    assert (recorder.logins, recorder.fetches) == (1, 2)
+
+
+async def test_fetch_cached_keeps_session_errors():
+    """Test that a month cache miss only hides non-session errors."""
+    client = make_client()
+    client._fetch_clear_cached()
+    today = datetime.date(2023, 3, 15)
+
+    async def missing(url_tail, endpoint=None):
+        raise SuezError("no data")
+
+    client._fetch_data_url = missing
+    assert await client._fetch_cached(today) is None
+
+    async def stale(url_tail, endpoint=None):
+        raise SuezSessionError("stale")
+
+    client._fetch_data_url = stale
+    with pytest.raises(SuezSessionError):
+        await client._fetch_cached(today)
+
+
+def month_rows(year, month, days, totals=None):
+    """Rows as returned by the website for one month, totals default to 0."""
+    totals = totals or {}
+    return [
+        [f"{day:02}/{month:02}/{year}", 0, totals.get(day, 0)]
+        for day in range(1, days + 1)
+    ]
+
+
+def stub_months(client, months):
+    """Serve _fetch_cached from {(year, month): rows}, recording the requests."""
+    requested = []
+
+    async def fetch_cached(date):
+        requested.append((date.year, date.month))
+        return months.get((date.year, date.month))
+
+    client._fetch_cached = fetch_cached
+    return requested
+
+
+async def test_last_known_stops_after_60_days():
+    """Test that the walk covers 60 days across month boundaries, not more."""
+    client = make_client()
+    today = datetime.date(2023, 3, 15)
+    # 15 days of March + 28 of February + 17 of January: Jan 15 is the last one
+    months = {
+        (2023, 3): month_rows(2023, 3, 31),
+        (2023, 2): month_rows(2023, 2, 28),
+        (2023, 1): month_rows(2023, 1, 31, {15: 7.5, 14: 9.0}),
+        (2022, 12): month_rows(2022, 12, 31, {31: 1.0}),
+    }
+    requested = stub_months(client, months)
+    assert await client._fetch_last_known(today) == 7.5
+    assert requested == [(2023, 3), (2023, 2), (2023, 1)]
+
+    months[(2023, 1)] = month_rows(2023, 1, 31, {14: 9.0})
+    requested = stub_months(client, months)
+    assert await client._fetch_last_known(today) == 0
+    assert requested == [(2023, 3), (2023, 2), (2023, 1)]
+
+
+async def test_last_known_short_current_month():
+    """Test a current month with fewer rows than today's date."""
+    client = make_client()
+    stub_months(client, {(2023, 3): month_rows(2023, 3, 10, {10: 3.25})})
+    assert await client._fetch_last_known(datetime.date(2023, 3, 15)) == 3.25
+
+
+async def test_last_known_skips_missing_month():
+    """Test that a month which could not be fetched is skipped."""
+    client = make_client()
+    stub_months(client, {(2023, 2): month_rows(2023, 2, 28, {20: 4.0})})
+    assert await client._fetch_last_known(datetime.date(2023, 3, 15)) == 4.0
+
+
+async def test_last_known_non_numeric_total():
+    """Test that a non numeric total is rejected."""
+    client = make_client()
+    rows = month_rows(2023, 3, 31)
+    rows[14][2] = "12.5"
+    stub_months(client, {(2023, 3): rows})
+    with pytest.raises(SuezError):
+        await client._fetch_last_known(datetime.date(2023, 3, 15))
+
+
+def test_to_day_map():
+    """Test building the day map, with values from the given columns."""
+    rows = [["01/03/2023", 0.5, 100.5], ["02/03/2023", 1, 101.5]]
+    assert _to_day_map(rows, 0, 1, 2) == {
+        "01/03/2023": (0.5, 100.5),
+        "02/03/2023": (1, 101.5),
+    }
+    history = [[0, 2.5, 30.0, "Mars 2023"]]
+    assert _to_day_map(history, 3, 1, 2) == {"Mars 2023": (2.5, 30.0)}
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        [20230301, 0.5, 100.5],
+        ["01/03/2023", "0.5", 100.5],
+        ["01/03/2023", 0.5, None],
+    ],
+)
+def test_to_day_map_rejects_malformed_rows(row):
+    """Test that a row with a wrong type raises SuezError."""
+    with pytest.raises(SuezError):
+        _to_day_map([row], 0, 1, 2)
+
+
+def test_to_day_map_rejects_short_rows():
+    """Test that a row with missing columns is not accepted."""
+    with pytest.raises(IndexError):
+        _to_day_map([["01/03/2023", 0.5]], 0, 1, 2)